@@ -0,0 +1,50 @@
+"""
+Comandos de administración:
+
+    python -m app.cli init-db       # crea tablas faltantes y registra la versión si no falta nada
+    python -m app.cli check-db      # verifica que la base tenga la versión esperada
+    python -m app.cli rebuild-stats # recalcula las altas diarias del rollup de estadísticas
+"""
+import argparse
+import sys
+
+from sqlmodel import Session
+
+from .database import SCHEMA_VERSION, SchemaVersionError, check_schema, get_engine, init_db
+from .stats import rebuild_created
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("init-db", help="Crear tablas y registrar la versión del esquema")
+    subparsers.add_parser("check-db", help="Verificar la versión del esquema")
+    subparsers.add_parser("rebuild-stats", help="Recalcular altas diarias desde routine.created_at")
+    args = parser.parse_args(argv)
+
+    if args.command == "init-db":
+        try:
+            init_db()
+        except SchemaVersionError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        print(f"Esquema inicializado (versión {SCHEMA_VERSION}).")
+        return 0
+
+    if args.command == "rebuild-stats":
+        with Session(get_engine()) as session:
+            days = rebuild_created(session)
+        print(f"Rollup recalculado: {days} días con altas.")
+        return 0
+
+    try:
+        check_schema()
+    except SchemaVersionError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    print(f"Esquema al día (versión {SCHEMA_VERSION}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
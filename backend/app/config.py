@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import List
+from typing import List, Literal
 
 from pydantic import BaseSettings, Field, validator
 
@@ -13,6 +13,15 @@ class Settings(BaseSettings):
     )
     cors_origins: List[str] = Field(default_factory=lambda: ["*"], env="CORS_ORIGINS")
     api_key: str | None = Field(default=None, env="API_KEY")
+    auto_init_db: bool = Field(default=False, env="AUTO_INIT_DB")
+    in_memory_reads: bool = Field(default=False, env="IN_MEMORY_READS")
+    profiling_history: int = Field(default=20, env="PROFILING_HISTORY")
+    changes_settle_seconds: float = Field(default=2.0, env="CHANGES_SETTLE_SECONDS")
+    invalidation_bus: Literal["auto", "postgres", "file", "none"] = Field(
+        default="auto", env="INVALIDATION_BUS"
+    )
+    invalidation_channel: str = Field(default="rutinas_invalidation", env="INVALIDATION_CHANNEL")
+    invalidation_file: str | None = Field(default=None, env="INVALIDATION_FILE")
 
     class Config:
         env_file = ".env"
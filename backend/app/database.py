@@ -1,18 +1,109 @@
-from typing import Generator
+import sqlite3
+from typing import Generator, List, Optional
 
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import delete, event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, SQLModel, create_engine, select
 
 from .config import get_settings
+from .models import SchemaVersion
 
-settings = get_settings()
+# Incrementar cuando cambie el esquema; el arranque exige que la base coincida.
+SCHEMA_VERSION = 2
 
-engine = create_engine(settings.database_url, echo=settings.debug, pool_pre_ping=True)
+_engine: Optional[Engine] = None
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    # SQLite no aplica ON DELETE CASCADE salvo que se activen las claves foráneas.
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def get_engine() -> Engine:
+    # El motor se crea en el primer uso: importar la app no carga el driver ni abre conexiones.
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        _engine = create_engine(settings.database_url, echo=settings.debug, pool_pre_ping=True)
+    return _engine
+
+
+def set_engine(engine: Optional[Engine]) -> None:
+    global _engine
+    _engine = engine
+
+
+def __getattr__(name: str):
+    # Compatibilidad con `from app.database import engine`.
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def dialect_insert(session: Session):
+    """`insert` del dialecto activo, con soporte de `on_conflict_do_*`."""
+    return _DIALECT_INSERTS[session.get_bind().dialect.name]
+
+
+def missing_schema_objects(engine: Engine) -> List[str]:
+    """Columnas e índices del modelo que no existen en la base."""
+    inspector = inspect(engine)
+    missing = []
+    for table in SQLModel.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(
+            f"{table.name}.{column.name}" for column in table.columns if column.name not in columns
+        )
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(index.name for index in table.indexes if index.name not in indexes)
+    return missing
 
 
 def init_db() -> None:
+    engine = get_engine()
+    # `create_all` solo crea tablas nuevas: no agrega columnas ni índices a las existentes,
+    # así que la versión se registra únicamente si la base quedó igual al modelo.
     SQLModel.metadata.create_all(engine)
+    missing = missing_schema_objects(engine)
+    if missing:
+        raise SchemaVersionError(
+            "Faltan columnas o índices: " + ", ".join(missing) + "; aplicar las migraciones "
+            "del README y volver a ejecutar `python -m app.cli init-db`"
+        )
+    with Session(engine) as session:
+        session.execute(delete(SchemaVersion))
+        session.add(SchemaVersion(version=SCHEMA_VERSION))
+        session.commit()
+
+
+def check_schema() -> None:
+    with Session(get_engine()) as session:
+        try:
+            version = session.exec(select(SchemaVersion.version)).first()
+        except DBAPIError as exc:
+            raise SchemaVersionError(
+                "No se pudo leer la versión del esquema; ejecutar `python -m app.cli init-db` "
+                f"({exc.orig})"
+            ) from exc
+    if version != SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Versión de esquema {version}, se esperaba {SCHEMA_VERSION}; "
+            "ejecutar `python -m app.cli init-db`"
+        )
 
 
 def get_session() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import os
+import select
+import tempfile
+import threading
+import uuid
+from collections import defaultdict
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+try:  # Windows no tiene fcntl: ahí las rotaciones no se sincronizan entre procesos.
+    import fcntl
+except ImportError:  # pragma: no cover - depende de la plataforma
+    fcntl = None
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+ROUTINES_TOPIC = "routines"
+
+# PostgreSQL limita el payload de NOTIFY a 8000 bytes.
+_MAX_NOTIFY_PAYLOAD = 7900
+_MAX_RECONNECT_DELAY = 30.0
+_MAX_FILE_BYTES = 1024 * 1024
+
+Callback = Callable[[Optional[List[int]]], None]
+
+
+class InvalidationBus:
+    """Bus sin transporte: publicar no tiene efecto fuera del proceso.
+
+    Las subclases envían cada mensaje a los demás workers, que lo reciben en
+    `_dispatch` e invocan a los suscriptores del tema. `ids=None` significa
+    "invalidar todo".
+    """
+
+    def __init__(self) -> None:
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._subscribers: Dict[str, List[Callback]] = defaultdict(list)
+
+    def subscribe(self, topic: str, callback: Callback) -> None:
+        self._subscribers[topic].append(callback)
+
+    def publish(self, topic: str, ids: Optional[List[int]] = None) -> None:
+        message = json.dumps({"origin": self.origin, "topic": topic, "ids": ids})
+        self._send(message)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def _send(self, message: str) -> None:
+        pass
+
+    def _dispatch(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.warning("Mensaje de invalidación inválido: %r", raw)
+            return
+        if message.get("origin") == self.origin:
+            return
+        self._notify(message.get("topic"), message.get("ids"))
+
+    def _notify(self, topic: str, ids: Optional[List[int]]) -> None:
+        for callback in self._subscribers.get(topic, []):
+            try:
+                callback(ids)
+            except Exception:
+                logger.exception("Error al aplicar invalidación %s", topic)
+
+
+class FileInvalidationBus(InvalidationBus):
+    """Transporte local por archivo compartido (un mensaje JSON por línea).
+
+    Pensado para varios workers en la misma máquina sin PostgreSQL y para tests:
+    `poll()` procesa de forma síncrona los mensajes pendientes. Al superar
+    `max_bytes` el archivo se renombra a `<path>.1` y se empieza uno nuevo; cada
+    lector termina de leer el archivo rotado por su descriptor abierto.
+    """
+
+    def __init__(
+        self, path: str, poll_interval: float = 0.2, max_bytes: int = _MAX_FILE_BYTES
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.rotated_path = path + ".1"
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._handle: Optional[BinaryIO] = None
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if os.path.exists(path):
+            self._open(at_end=True)
+
+    def _send(self, message: str) -> None:
+        data = (message + "\n").encode("utf-8")
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                if not self._is_current(os.fstat(fd).st_ino):
+                    continue  # Otro proceso rotó el archivo entre el open y el lock.
+                os.write(fd, data)
+                if os.fstat(fd).st_size >= self.max_bytes:
+                    os.replace(self.path, self.rotated_path)
+                return
+            finally:
+                os.close(fd)
+
+    def _is_current(self, inode: int) -> bool:
+        try:
+            return os.stat(self.path).st_ino == inode
+        except FileNotFoundError:
+            return False
+
+    def _open(self, at_end: bool = False) -> bool:
+        try:
+            self._handle = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        stat = os.fstat(self._handle.fileno())
+        self._inode = stat.st_ino
+        self._offset = stat.st_size if at_end else 0
+        return True
+
+    def _read_complete_lines(self) -> bytes:
+        self._handle.seek(self._offset)
+        data = self._handle.read()
+        # Solo se consumen líneas completas; el resto queda para la próxima lectura.
+        complete = data[: data.rfind(b"\n") + 1]
+        self._offset += len(complete)
+        return complete
+
+    def poll(self) -> None:
+        missed = False
+        chunks = []
+        with self._lock:
+            if self._handle is None and not self._open():
+                return
+            try:
+                current_inode = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current_inode = None
+            if current_inode != self._inode:
+                # Rotado: primero se termina el archivo anterior, todavía abierto.
+                chunks.append(self._read_complete_lines())
+                try:
+                    missed = os.stat(self.rotated_path).st_ino != self._inode
+                except FileNotFoundError:
+                    missed = True
+                self._close()
+                if current_inode is not None:
+                    self._open()
+            elif os.fstat(self._handle.fileno()).st_size < self._offset:
+                self._offset = 0  # Truncado desde afuera.
+            if self._handle is not None:
+                chunks.append(self._read_complete_lines())
+        for line in b"".join(chunks).decode("utf-8").splitlines():
+            if line.strip():
+                self._dispatch(line)
+        if missed:
+            # Hubo al menos un archivo rotado que este lector nunca vio: se invalida todo.
+            for topic in list(self._subscribers):
+                self._notify(topic, None)
+
+    def _close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+        self._handle = None
+        self._inode = None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="invalidation-file-bus", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval * 5)
+            self._thread = None
+        with self._lock:
+            self._close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except OSError:
+                logger.exception("No se pudo leer %s", self.path)
+
+
+class PostgresInvalidationBus(InvalidationBus):
+    """Transporte con LISTEN/NOTIFY de PostgreSQL, compartido por todos los workers."""
+
+    def __init__(self, engine: Engine, channel: str, poll_interval: float = 1.0) -> None:
+        super().__init__()
+        self.engine = engine
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, topic: str, ids: Optional[List[int]] = None) -> None:
+        message = json.dumps({"origin": self.origin, "topic": topic, "ids": ids})
+        if len(message) > _MAX_NOTIFY_PAYLOAD:
+            message = json.dumps({"origin": self.origin, "topic": topic, "ids": None})
+        self._send(message)
+
+    def _send(self, message: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": message},
+            )
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="invalidation-pg-bus", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval * 5)
+            self._thread = None
+
+    def _run(self) -> None:
+        delay = self.poll_interval
+        reconnecting = False
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self.engine.raw_connection()
+                dbapi_connection = connection.connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                delay = self.poll_interval
+                if reconnecting:
+                    # Lo publicado mientras no había conexión se perdió: se invalida todo.
+                    for topic in list(self._subscribers):
+                        self._notify(topic, None)
+                self._listen(dbapi_connection)
+            except Exception:
+                reconnecting = True
+                logger.exception("El listener de invalidación falló; reintento en %.1fs", delay)
+                self._stop.wait(delay)
+                delay = min(delay * 2, _MAX_RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    connection.invalidate()
+
+    def _listen(self, dbapi_connection) -> None:
+        while not self._stop.is_set():
+            ready, _, _ = select.select([dbapi_connection], [], [], self.poll_interval)
+            if not ready:
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                self._dispatch(dbapi_connection.notifies.pop(0).payload)
+
+
+_bus: InvalidationBus = InvalidationBus()
+
+
+def get_bus() -> InvalidationBus:
+    return _bus
+
+
+def set_bus(bus: InvalidationBus) -> None:
+    global _bus
+    _bus.stop()
+    _bus = bus
+
+
+def publish(topic: str, ids: Optional[List[int]] = None) -> None:
+    # Se llama después del commit: un fallo del transporte no debe convertir en error
+    # una escritura que ya quedó guardada.
+    try:
+        _bus.publish(topic, ids)
+    except Exception:
+        logger.exception("No se pudo publicar la invalidación %s", topic)
+
+
+def default_invalidation_file(settings: Settings) -> str:
+    # Un archivo por base y canal: dos despliegues en la misma máquina no se invalidan entre sí.
+    digest = hashlib.sha256(settings.database_url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"{settings.invalidation_channel}-{digest}.log")
+
+
+def build_bus(settings: Settings, engine: Engine) -> InvalidationBus:
+    backend = settings.invalidation_bus
+    if backend == "auto":
+        backend = "postgres" if engine.dialect.name == "postgresql" else "none"
+    if backend == "postgres":
+        return PostgresInvalidationBus(engine, settings.invalidation_channel)
+    if backend == "file":
+        path = settings.invalidation_file or default_invalidation_file(settings)
+        return FileInvalidationBus(path)
+    return InvalidationBus()
@@ -1,9 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from . import database
 from .config import get_settings
-from .database import init_db
-from .routers import routines
+from .database import check_schema, init_db
+from .invalidation import ROUTINES_TOPIC, build_bus, get_bus, set_bus
+from .profiling import ProfilingMiddleware
+from .read_model import invalidate_snapshot, load_snapshot
+from .routers import exercises, profiles, routines
 
 settings = get_settings()
 
@@ -16,11 +20,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
 
 
 @app.on_event("startup")
 def on_startup() -> None:
-    init_db()
+    if settings.auto_init_db:
+        init_db()
+    else:
+        check_schema()
+    if settings.in_memory_reads:
+        load_snapshot()
+        # Sin copia en memoria no hay nada que invalidar: queda el bus nulo por defecto.
+        bus = build_bus(settings, database.get_engine())
+        bus.subscribe(ROUTINES_TOPIC, invalidate_snapshot)
+        set_bus(bus)
+        bus.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    get_bus().stop()
 
 
 @app.get("/health")
@@ -29,3 +49,5 @@ def health() -> dict:
 
 
 app.include_router(routines.router, prefix="/api")
+app.include_router(exercises.router, prefix="/api")
+app.include_router(profiles.router, prefix="/api")
@@ -1,8 +1,8 @@
 import enum
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Column, ForeignKey, Integer, UniqueConstraint
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -16,20 +16,48 @@ class DayOfWeek(str, enum.Enum):
     DOMINGO = "Domingo"
 
 
+class ExerciseCatalog(SQLModel, table=True):
+    __tablename__ = "exercise_catalog"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(nullable=False, unique=True, index=True)
+
+    exercises: list["Exercise"] = Relationship(back_populates="catalog")
+
+
 class Exercise(SQLModel, table=True):
     __tablename__ = "exercise"
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str = Field(nullable=False)
+    catalog_id: int = Field(foreign_key="exercise_catalog.id", nullable=False, index=True)
     day_of_week: DayOfWeek = Field(index=True, nullable=False)
     series: int = Field(nullable=False)
     repetitions: int = Field(nullable=False)
     weight: Optional[float] = Field(default=None, nullable=True)
     notes: Optional[str] = Field(default=None)
     order: int = Field(default=1, nullable=False)
-    routine_id: int = Field(foreign_key="routine.id", nullable=False)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        nullable=False,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
+    routine_id: int = Field(
+        sa_column=Column(
+            Integer,
+            ForeignKey("routine.id", ondelete="CASCADE"),
+            nullable=False,
+            index=True,
+        )
+    )
 
     routine: Optional["Routine"] = Relationship(back_populates="exercises")
+    catalog: Optional[ExerciseCatalog] = Relationship(
+        back_populates="exercises", sa_relationship_kwargs={"lazy": "joined"}
+    )
+
+    @property
+    def name(self) -> str:
+        return self.catalog.name if self.catalog else ""
 
 
 class Routine(SQLModel, table=True):
@@ -39,12 +67,42 @@ class Routine(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True, nullable=False)
     description: Optional[str] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        nullable=False,
+        index=True,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
 
     exercises: list[Exercise] = Relationship(
         back_populates="routine",
         sa_relationship_kwargs={
             "cascade": "all, delete-orphan",
+            "passive_deletes": True,
             "order_by": "Exercise.order",
         },
     )
+
+
+class RoutineTombstone(SQLModel, table=True):
+    __tablename__ = "routine_tombstone"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    routine_id: int = Field(nullable=False)
+    deleted_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+
+
+class RoutineDailyStats(SQLModel, table=True):
+    __tablename__ = "routine_daily_stats"
+
+    day: date = Field(primary_key=True)
+    created: int = Field(default=0, nullable=False)
+    updated: int = Field(default=0, nullable=False)
+    deleted: int = Field(default=0, nullable=False)
+
+
+class SchemaVersion(SQLModel, table=True):
+    __tablename__ = "schema_version"
+
+    version: int = Field(primary_key=True)
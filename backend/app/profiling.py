@@ -0,0 +1,234 @@
+import cProfile
+import functools
+import inspect
+import io
+import marshal
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import get_settings
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_TRUTHY = {"1", "true", "yes", "on"}
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar(
+    "current_profile", default=None
+)
+
+
+class RequestProfile:
+    """Perfil de una única petición: árbol de llamadas (cProfile) y sentencias SQL."""
+
+    def __init__(self, method: str, path: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.status_code: Optional[int] = None
+        self.duration_ms: float = 0.0
+        self.statements: List[Dict[str, Any]] = []
+        self.profiler = cProfile.Profile()
+
+    def run(self, call: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return self.profiler.runcall(call, *args, **kwargs)
+
+    async def run_async(self, call: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self.profiler.enable()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+
+    def stats_text(self, limit: int = 50) -> str:
+        buffer = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profiler, stream=buffer)
+        except TypeError:
+            # El perfilador nunca se activó (p. ej. la ruta no usa ProfilingRoute).
+            return ""
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return buffer.getvalue()
+
+    def dump(self) -> bytes:
+        """Serializa el perfil en el formato de `pstats` (compatible con snakeviz)."""
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "sql_count": len(self.statements),
+            "sql_ms": round(sum(item["duration_ms"] for item in self.statements), 3),
+        }
+
+    def detail(self) -> Dict[str, Any]:
+        return {**self.summary(), "sql": self.statements, "call_tree": self.stats_text()}
+
+
+class ProfileStore:
+    """Historial acotado en memoria con los últimos perfiles del proceso."""
+
+    def __init__(self) -> None:
+        self._items: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile, max_items: int) -> None:
+        with self._lock:
+            self._items[profile.id] = profile
+            while len(self._items) > max(max_items, 1):
+                self._items.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._items.get(profile_id)
+
+    def recent(self) -> List[RequestProfile]:
+        with self._lock:
+            return list(reversed(self._items.values()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+profile_store = ProfileStore()
+
+
+def profiling_enabled() -> bool:
+    settings = get_settings()
+    return settings.debug and bool(settings.api_key)
+
+
+def _profiling_requested(request: Request) -> bool:
+    flag = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY_PARAM)
+    if not flag or flag.lower() not in _TRUTHY:
+        return False
+    return request.headers.get("X-API-Key") == get_settings().api_key
+
+
+# cProfile admite un solo perfilador activo por proceso (Python 3.12+): un perfil a la vez.
+_profiling_lock = threading.Lock()
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI puro: sin perfilado habilitado solo agrega una comprobación de settings."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiling_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        if not _profiling_requested(request):
+            await self.app(scope, receive, send)
+            return
+
+        if not _profiling_lock.acquire(blocking=False):
+            response = JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": "Ya hay un perfil en curso"},
+            )
+            await response(scope, receive, send)
+            return
+
+        profile = RequestProfile(request.method, request.url.path)
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers[PROFILE_ID_HEADER] = profile.id
+            await send(message)
+
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            _current_profile.reset(token)
+            _profiling_lock.release()
+            profile_store.add(profile, get_settings().profiling_history)
+
+
+def _profile_endpoint(call: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(call):
+
+        @functools.wraps(call)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = _current_profile.get()
+            if profile is None:
+                return await call(*args, **kwargs)
+            return await profile.run_async(call, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(call)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        profile = _current_profile.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        return profile.run(call, *args, **kwargs)
+
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """Ruta que ejecuta el endpoint bajo cProfile cuando la petición pidió perfilado.
+
+    Los endpoints síncronos corren en el threadpool; envolver la función del endpoint
+    garantiza que el perfilador se active en el mismo hilo que hace el trabajo.
+    """
+
+    def get_route_handler(self):
+        self.dependant.call = _profile_endpoint(self.dependant.call)
+        return super().get_route_handler()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile.get() is not None:
+        conn.info.setdefault("profiling_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is None:
+        return
+    starts = conn.info.get("profiling_start")
+    if not starts:
+        return
+    profile.statements.append(
+        {
+            "statement": statement,
+            "parameters": repr(parameters),
+            "executemany": executemany,
+            "duration_ms": round((time.perf_counter() - starts.pop()) * 1000, 3),
+        }
+    )
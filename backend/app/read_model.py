@@ -0,0 +1,217 @@
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+
+from . import database
+from .models import DayOfWeek, Exercise, Routine
+
+
+class ExerciseRecord:
+    __slots__ = (
+        "id",
+        "name",
+        "day_of_week",
+        "series",
+        "repetitions",
+        "weight",
+        "notes",
+        "order",
+        "routine_id",
+    )
+
+    def __init__(self, exercise: Exercise) -> None:
+        self.id = exercise.id
+        self.name = exercise.name
+        self.day_of_week = DayOfWeek(exercise.day_of_week)
+        self.series = exercise.series
+        self.repetitions = exercise.repetitions
+        self.weight = exercise.weight
+        self.notes = exercise.notes
+        self.order = exercise.order
+        self.routine_id = exercise.routine_id
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+
+class RoutineRecord:
+    __slots__ = ("id", "name", "description", "created_at", "updated_at", "exercises", "days")
+
+    def __init__(self, routine: Routine) -> None:
+        self.id = routine.id
+        self.name = routine.name
+        self.description = routine.description
+        self.created_at = routine.created_at
+        self.updated_at = routine.updated_at
+        self.exercises = sorted(
+            (ExerciseRecord(exercise) for exercise in routine.exercises),
+            key=lambda exercise: (exercise.order, exercise.id),
+        )
+        self.days = frozenset(exercise.day_of_week for exercise in self.exercises)
+
+    def as_tuple(self) -> tuple:
+        return (
+            self.id,
+            self.name,
+            self.description,
+            self.created_at,
+            self.updated_at,
+            tuple(exercise.as_tuple() for exercise in self.exercises),
+        )
+
+
+class RoutineSnapshot:
+    """Catálogo completo en memoria para servir lecturas sin tocar la base.
+
+    Las escrituras siguen yendo a la base; después de cada commit el router
+    actualiza la copia con `refresh`/`discard`.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._routines: Dict[int, RoutineRecord] = {}
+        self._ids: List[int] = []
+        self._by_day: Dict[DayOfWeek, List[int]] = {day: [] for day in DayOfWeek}
+        self._day_counts: Counter = Counter()
+        self._total_exercises = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self.loaded = False
+            self._routines = {}
+            self._ids = []
+            self._by_day = {day: [] for day in DayOfWeek}
+            self._day_counts = Counter()
+            self._total_exercises = 0
+
+    def load(self, session: Session) -> None:
+        routines = session.exec(
+            select(Routine).options(selectinload(Routine.exercises)).order_by(Routine.id)
+        ).all()
+        with self._lock:
+            self.clear()
+            for routine in routines:
+                self._put(RoutineRecord(routine))
+            self.loaded = True
+
+    def refresh(self, session: Session, routine_id: int) -> None:
+        if not self.loaded:
+            return
+        routine = session.exec(
+            select(Routine)
+            .options(selectinload(Routine.exercises))
+            .where(Routine.id == routine_id)
+            .execution_options(populate_existing=True)
+        ).first()
+        with self._lock:
+            current = self._routines.get(routine_id)
+            # La lectura se hace fuera del lock: si otra escritura ya aplicó una versión
+            # más nueva de la rutina, esta lectura es vieja y se descarta.
+            if routine and current and routine.updated_at < current.updated_at:
+                return
+            self._remove(routine_id)
+            if routine:
+                self._put(RoutineRecord(routine))
+
+    def discard(
+        self,
+        ids: Optional[Iterable[int]] = None,
+        created_before: Optional[datetime] = None,
+    ) -> None:
+        if not self.loaded:
+            return
+        with self._lock:
+            candidates = list(ids) if ids is not None else list(self._ids)
+            for routine_id in candidates:
+                record = self._routines.get(routine_id)
+                if record is None:
+                    continue
+                if created_before is not None and not record.created_at < created_before:
+                    continue
+                self._remove(routine_id)
+
+    def get(self, routine_id: int) -> Optional[RoutineRecord]:
+        return self._routines.get(routine_id)
+
+    def page(
+        self, page: int, page_size: int, day: Optional[DayOfWeek] = None
+    ) -> Tuple[int, List[RoutineRecord]]:
+        with self._lock:
+            ids = self._by_day[day] if day else self._ids
+            start = (page - 1) * page_size
+            selected = ids[start : start + page_size]
+            return len(ids), [self._routines[routine_id] for routine_id in selected]
+
+    def stats(self) -> Tuple[int, int, Dict[str, int]]:
+        with self._lock:
+            per_day = {day.value: count for day, count in self._day_counts.items() if count}
+            return len(self._routines), self._total_exercises, per_day
+
+    def differences(self, session: Session) -> List[str]:
+        fresh = RoutineSnapshot()
+        fresh.load(session)
+        with self._lock:
+            current = {key: record.as_tuple() for key, record in self._routines.items()}
+        expected = {key: record.as_tuple() for key, record in fresh._routines.items()}
+
+        problems = []
+        for routine_id in sorted(expected.keys() - current.keys()):
+            problems.append(f"Rutina {routine_id} falta en memoria")
+        for routine_id in sorted(current.keys() - expected.keys()):
+            problems.append(f"Rutina {routine_id} no existe en la base")
+        for routine_id in sorted(current.keys() & expected.keys()):
+            if current[routine_id] != expected[routine_id]:
+                problems.append(f"Rutina {routine_id} difiere de la base")
+        return problems
+
+    def _put(self, record: RoutineRecord) -> None:
+        self._routines[record.id] = record
+        insort(self._ids, record.id)
+        for day in record.days:
+            insort(self._by_day[day], record.id)
+        for exercise in record.exercises:
+            self._day_counts[exercise.day_of_week] += 1
+        self._total_exercises += len(record.exercises)
+
+    def _remove(self, routine_id: int) -> None:
+        record = self._routines.pop(routine_id, None)
+        if record is None:
+            return
+        _remove_sorted(self._ids, routine_id)
+        for day in record.days:
+            _remove_sorted(self._by_day[day], routine_id)
+        for exercise in record.exercises:
+            self._day_counts[exercise.day_of_week] -= 1
+        self._total_exercises -= len(record.exercises)
+
+
+def _remove_sorted(values: List[int], value: int) -> None:
+    index = bisect_left(values, value)
+    if index < len(values) and values[index] == value:
+        del values[index]
+
+
+snapshot = RoutineSnapshot()
+
+
+def load_snapshot() -> None:
+    with Session(database.get_engine()) as session:
+        snapshot.load(session)
+
+
+def invalidate_snapshot(ids: Optional[List[int]]) -> None:
+    """Aplica una invalidación publicada por otro worker."""
+    if not snapshot.loaded:
+        return
+    if ids is None:
+        load_snapshot()
+        return
+    with Session(database.get_engine()) as session:
+        for routine_id in ids:
+            snapshot.refresh(session, routine_id)
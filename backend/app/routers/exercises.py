@@ -0,0 +1,69 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+
+from ..database import get_session
+from ..models import Exercise, ExerciseCatalog, Routine
+from ..profiling import ProfilingRoute
+from ..schemas import ExerciseCatalogRead, PaginatedRoutineRead
+from ..security import get_auth_dependency
+from .routines import _paginate_query
+
+router = APIRouter(
+    prefix="/ejercicios",
+    tags=["Ejercicios"],
+    dependencies=[get_auth_dependency()],
+    route_class=ProfilingRoute,
+)
+
+
+@router.get("", response_model=List[ExerciseCatalogRead])
+def list_catalog(
+    nombre: str = Query("", description="Texto a buscar (parcial, case-insensitive)"),
+    limit: int = Query(50, gt=0, le=500),
+    session: Session = Depends(get_session),
+) -> List[ExerciseCatalogRead]:
+    usage_count = func.count(func.distinct(Exercise.routine_id))
+    query = (
+        select(ExerciseCatalog.id, ExerciseCatalog.name, usage_count)
+        .outerjoin(Exercise, Exercise.catalog_id == ExerciseCatalog.id)
+        .group_by(ExerciseCatalog.id, ExerciseCatalog.name)
+        .order_by(usage_count.desc(), ExerciseCatalog.name)
+        .limit(limit)
+    )
+    term = nombre.strip()
+    if term:
+        query = query.where(func.lower(ExerciseCatalog.name).like(f"%{term.lower()}%"))
+
+    return [
+        ExerciseCatalogRead(id=entry_id, name=name, usage_count=count)
+        for entry_id, name, count in session.exec(query).all()
+    ]
+
+
+@router.get("/{catalog_id}/rutinas", response_model=PaginatedRoutineRead)
+def list_routines_using_exercise(
+    catalog_id: int,
+    page: int = Query(1, gt=0),
+    page_size: int = Query(20, gt=0, le=100),
+    session: Session = Depends(get_session),
+) -> PaginatedRoutineRead:
+    if not session.get(ExerciseCatalog, catalog_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ejercicio no encontrado")
+
+    # Búsqueda por índice en exercise.catalog_id en lugar de comparar texto.
+    base_query = (
+        select(Routine)
+        .options(selectinload(Routine.exercises))
+        .where(
+            Routine.id.in_(
+                select(Exercise.routine_id).where(Exercise.catalog_id == catalog_id)
+            )
+        )
+        .order_by(Routine.id)
+    )
+    total, pages, routines = _paginate_query(session, base_query, page, page_size)
+    return PaginatedRoutineRead.from_query(routines, total, page, page_size, pages)
@@ -0,0 +1,48 @@
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Response, status
+
+from ..profiling import profile_store, profiling_enabled
+from ..schemas import ProfileRead, ProfileSummaryRead
+from ..security import get_auth_dependency
+
+router = APIRouter(
+    prefix="/perfiles",
+    tags=["Perfiles"],
+    dependencies=[get_auth_dependency()],
+)
+
+
+def _ensure_enabled() -> None:
+    if not profiling_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Perfilado deshabilitado"
+        )
+
+
+@router.get("", response_model=List[ProfileSummaryRead])
+def list_profiles() -> List[ProfileSummaryRead]:
+    _ensure_enabled()
+    return [profile.summary() for profile in profile_store.recent()]
+
+
+@router.get("/{profile_id}", response_model=ProfileRead)
+def get_profile(profile_id: str) -> ProfileRead:
+    _ensure_enabled()
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil no encontrado")
+    return profile.detail()
+
+
+@router.get("/{profile_id}/descarga")
+def download_profile(profile_id: str) -> Response:
+    _ensure_enabled()
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil no encontrado")
+    return Response(
+        content=profile.dump(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename=perfil-{profile.id}.prof"},
+    )
@@ -1,28 +1,42 @@
-from typing import List, Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy import func
+from sqlalchemy import and_, case, delete, false, func, insert, literal, or_, update
 from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
 
-from ..database import get_session
-from ..models import DayOfWeek, Exercise, Routine
+from ..config import get_settings
+from ..database import dialect_insert, get_session
+from ..invalidation import ROUTINES_TOPIC, publish
+from ..models import DayOfWeek, Exercise, ExerciseCatalog, Routine, RoutineTombstone
+from ..profiling import ProfilingRoute
+from ..read_model import snapshot
 from ..schemas import (
+    BulkDeleteRead,
     ExerciseIn,
+    ExerciseOrderUpdate,
     ExerciseRead,
     PaginatedRoutineRead,
+    ReadModelCheckRead,
+    RoutineChangesRead,
     RoutineCreate,
     RoutineRead,
     RoutineUpdate,
+    StatsBucket,
     StatsRead,
+    StatsSeriesRead,
 )
 from ..security import get_auth_dependency
+from ..stats import SeriesRangeError, record_activity, series
+from ..streaming import ndjson_response, wants_ndjson
 
 router = APIRouter(
     prefix="/rutinas",
     tags=["Rutinas"],
     dependencies=[get_auth_dependency()],
+    route_class=ProfilingRoute,
 )
 
 
@@ -33,10 +47,11 @@ def _paginate_query(
     page_size: int,
     distinct_routine: bool = False,
 ):
+    subquery = base_query.subquery()
     count_stmt = (
-        select(func.count(func.distinct(Routine.id))).select_from(base_query.subquery())
+        select(func.count(func.distinct(subquery.c.id))).select_from(subquery)
         if distinct_routine
-        else select(func.count()).select_from(base_query.subquery())
+        else select(func.count()).select_from(subquery)
     )
     total = session.exec(count_stmt).one()
     items = (
@@ -48,13 +63,82 @@ def _paginate_query(
     return total, pages, items
 
 
+def _catalog_entries(session: Session, names: Iterable[str]) -> Dict[str, ExerciseCatalog]:
+    wanted = set(names)
+    if not wanted:
+        return {}
+    query = select(ExerciseCatalog).where(ExerciseCatalog.name.in_(wanted))
+    entries = {entry.name: entry for entry in session.exec(query).all()}
+    missing = sorted(wanted - entries.keys())
+    if missing:
+        # Otra petición puede crear el mismo nombre en paralelo: ON CONFLICT evita el
+        # IntegrityError y la segunda lectura devuelve la fila que haya quedado.
+        insert = dialect_insert(session)
+        session.execute(
+            insert(ExerciseCatalog.__table__)
+            .values([{"name": name} for name in missing])
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        entries = {entry.name: entry for entry in session.exec(query).all()}
+    return entries
+
+
+def _routines_changed(session: Session, routine_id: int) -> None:
+    snapshot.refresh(session, routine_id)
+    publish(ROUTINES_TOPIC, [routine_id])
+
+
+def _day_condition(dia: DayOfWeek):
+    return Routine.id.in_(select(Exercise.routine_id).where(Exercise.day_of_week == dia))
+
+
+def _touch_routine(session: Session, routine_id: int) -> None:
+    session.execute(
+        update(Routine)
+        .where(Routine.id == routine_id)
+        .values(updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Las columnas guardan UTC sin zona: una fecha con offset se normaliza a ese formato.
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _encode_cursor(changed_at: datetime, routine_id: int) -> str:
+    return f"{changed_at.isoformat()}_{routine_id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    timestamp, _, routine_id = cursor.partition("_")
+    try:
+        changed_at, routine_id = datetime.fromisoformat(timestamp), int(routine_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    return _naive_utc(changed_at), routine_id
+
+
 @router.get("", response_model=PaginatedRoutineRead)
 def list_routines(
+    request: Request,
+    response: Response,
     page: int = Query(1, gt=0),
     page_size: int = Query(20, gt=0, le=100),
     dia: Optional[DayOfWeek] = Query(default=None, description="Filtrar por día de la semana"),
     session: Session = Depends(get_session),
 ) -> PaginatedRoutineRead:
+    if wants_ndjson(request):
+        return ndjson_response(request, [_day_condition(dia)] if dia else [])
+    response.headers["Vary"] = "Accept"
+
+    if snapshot.loaded:
+        total, routines = snapshot.page(page, page_size, dia)
+        pages = (total + page_size - 1) // page_size if total else 1
+        return PaginatedRoutineRead.from_query(routines, total, page, page_size, pages)
+
     base_query = select(Routine).options(selectinload(Routine.exercises))
     if dia:
         base_query = (
@@ -71,6 +155,8 @@ def list_routines(
 
 @router.get("/buscar", response_model=PaginatedRoutineRead)
 def search_routines(
+    request: Request,
+    response: Response,
     nombre: str = Query("", description="Texto a buscar (parcial, case-insensitive)"),
     page: int = Query(1, gt=0),
     page_size: int = Query(20, gt=0, le=100),
@@ -78,6 +164,13 @@ def search_routines(
     session: Session = Depends(get_session),
 ) -> PaginatedRoutineRead:
     term = nombre.strip()
+    if wants_ndjson(request):
+        conditions = [func.lower(Routine.name).like(f"%{term.lower()}%")] if term else [false()]
+        if dia:
+            conditions.append(_day_condition(dia))
+        return ndjson_response(request, conditions)
+    response.headers["Vary"] = "Accept"
+
     if not term:
         return PaginatedRoutineRead.from_query([], 0, page, page_size, 0)
 
@@ -95,6 +188,14 @@ def search_routines(
 
 @router.get("/estadisticas", response_model=StatsRead)
 def get_stats(session: Session = Depends(get_session)) -> StatsRead:
+    if snapshot.loaded:
+        total_routines, total_exercises, per_day = snapshot.stats()
+        return StatsRead(
+            total_routines=total_routines,
+            total_exercises=total_exercises,
+            exercises_per_day=per_day,
+        )
+
     total_routines = session.exec(select(func.count(Routine.id))).one()
     total_exercises = session.exec(select(func.count(Exercise.id))).one()
     per_day = session.exec(
@@ -107,6 +208,25 @@ def get_stats(session: Session = Depends(get_session)) -> StatsRead:
     )
 
 
+@router.get("/estadisticas/serie", response_model=StatsSeriesRead)
+def get_stats_series(
+    bucket: StatsBucket = Query(StatsBucket.DAY, description="Agrupar por day, week o month"),
+    desde: Optional[date] = Query(default=None, description="Primer día incluido"),
+    hasta: Optional[date] = Query(default=None, description="Último día incluido"),
+    session: Session = Depends(get_session),
+) -> StatsSeriesRead:
+    if desde and hasta and desde > hasta:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="desde no puede ser posterior a hasta",
+        )
+    try:
+        items = series(session, bucket, desde, hasta)
+    except SeriesRangeError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return StatsSeriesRead(bucket=bucket, items=items)
+
+
 @router.get("/export/csv")
 def export_csv(session: Session = Depends(get_session)) -> StreamingResponse:
     import csv
@@ -161,8 +281,98 @@ def export_csv(session: Session = Depends(get_session)) -> StreamingResponse:
     )
 
 
+@router.get("/cambios", response_model=RoutineChangesRead)
+def list_changes(
+    since: Optional[str] = Query(
+        default=None,
+        description="Cursor devuelto por la llamada anterior (o fecha ISO para empezar)",
+    ),
+    limit: int = Query(100, gt=0, le=1000),
+    session: Session = Depends(get_session),
+) -> RoutineChangesRead:
+    # `updated_at` se fija antes del commit: una transacción lenta puede hacer visible un
+    # cambio con fecha anterior al cursor ya entregado. Los cambios más nuevos que el margen
+    # todavía no se publican, así ningún commit tardío queda detrás del cursor.
+    horizon = datetime.utcnow() - timedelta(seconds=get_settings().changes_settle_seconds)
+    routines_query = (
+        select(Routine)
+        .options(selectinload(Routine.exercises))
+        .where(Routine.updated_at <= horizon)
+        .order_by(Routine.updated_at, Routine.id)
+        .limit(limit + 1)
+    )
+    tombstones_query = (
+        select(RoutineTombstone)
+        .where(RoutineTombstone.deleted_at <= horizon)
+        .order_by(RoutineTombstone.deleted_at, RoutineTombstone.routine_id)
+        .limit(limit + 1)
+    )
+    since_at = None
+    if since:
+        since_at, since_id = _decode_cursor(since)
+        routines_query = routines_query.where(
+            or_(
+                Routine.updated_at > since_at,
+                and_(Routine.updated_at == since_at, Routine.id > since_id),
+            )
+        )
+        tombstones_query = tombstones_query.where(
+            or_(
+                RoutineTombstone.deleted_at > since_at,
+                and_(
+                    RoutineTombstone.deleted_at == since_at,
+                    RoutineTombstone.routine_id > since_id,
+                ),
+            )
+        )
+
+    changes = sorted(
+        [(routine.updated_at, routine.id, routine) for routine in session.exec(routines_query)]
+        + [
+            (tombstone.deleted_at, tombstone.routine_id, None)
+            for tombstone in session.exec(tombstones_query)
+        ],
+        key=lambda change: (change[0], change[1]),
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    created, updated, deleted = [], [], []
+    for _, routine_id, routine in changes:
+        if routine is None:
+            deleted.append(routine_id)
+        elif since_at is None or routine.created_at > since_at:
+            created.append(routine)
+        else:
+            updated.append(routine)
+
+    return RoutineChangesRead(
+        created=created,
+        updated=updated,
+        deleted=deleted,
+        next_cursor=_encode_cursor(*changes[-1][:2]) if changes else since,
+        has_more=has_more,
+    )
+
+
+@router.get("/memoria/consistencia", response_model=ReadModelCheckRead)
+def check_read_model(session: Session = Depends(get_session)) -> ReadModelCheckRead:
+    if not snapshot.loaded:
+        return ReadModelCheckRead(enabled=False, consistent=True, differences=[])
+    differences = snapshot.differences(session)
+    return ReadModelCheckRead(enabled=True, consistent=not differences, differences=differences)
+
+
 @router.get("/{routine_id}", response_model=RoutineRead)
 def get_routine(routine_id: int, session: Session = Depends(get_session)) -> RoutineRead:
+    if snapshot.loaded:
+        record = snapshot.get(routine_id)
+        if not record:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Rutina no encontrada"
+            )
+        return record
+
     routine = session.exec(
         select(Routine)
         .options(selectinload(Routine.exercises))
@@ -188,11 +398,12 @@ def create_routine(
             detail="Ya existe una rutina con ese nombre",
         )
 
+    catalog = _catalog_entries(session, (exercise_data.name for exercise_data in payload.exercises))
     routine = Routine(name=payload.name, description=payload.description)
     for exercise_data in payload.exercises:
         routine.exercises.append(
             Exercise(
-                name=exercise_data.name,
+                catalog=catalog[exercise_data.name],
                 day_of_week=exercise_data.day_of_week,
                 series=exercise_data.series,
                 repetitions=exercise_data.repetitions,
@@ -204,7 +415,9 @@ def create_routine(
 
     session.add(routine)
     session.commit()
+    record_activity(session, created=1)
     session.refresh(routine)
+    _routines_changed(session, routine.id)
     return routine
 
 
@@ -234,9 +447,11 @@ def update_routine(
 
     routine.name = payload.name
     routine.description = payload.description
+    routine.updated_at = datetime.utcnow()
 
     existing_by_id = {exercise.id: exercise for exercise in routine.exercises if exercise.id}
     received_ids = set()
+    catalog = _catalog_entries(session, (exercise_data.name for exercise_data in payload.exercises))
 
     for exercise_data in payload.exercises:
         if exercise_data.id:
@@ -246,7 +461,7 @@ def update_routine(
                     detail=f"Ejercicio con id {exercise_data.id} no pertenece a la rutina",
                 )
             exercise = existing_by_id[exercise_data.id]
-            exercise.name = exercise_data.name
+            exercise.catalog = catalog[exercise_data.name]
             exercise.day_of_week = exercise_data.day_of_week
             exercise.series = exercise_data.series
             exercise.repetitions = exercise_data.repetitions
@@ -257,7 +472,7 @@ def update_routine(
         else:
             routine.exercises.append(
                 Exercise(
-                    name=exercise_data.name,
+                    catalog=catalog[exercise_data.name],
                     day_of_week=exercise_data.day_of_week,
                     series=exercise_data.series,
                     repetitions=exercise_data.repetitions,
@@ -273,21 +488,64 @@ def update_routine(
 
     session.add(routine)
     session.commit()
+    record_activity(session, updated=1)
     session.refresh(routine)
+    _routines_changed(session, routine.id)
     return routine
 
 
 @router.delete("/{routine_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_routine(routine_id: int, session: Session = Depends(get_session)) -> Response:
-    routine = session.get(Routine, routine_id)
-    if not routine:
+    # ON DELETE CASCADE en exercise.routine_id: la base borra los ejercicios en la misma sentencia.
+    result = session.execute(delete(Routine).where(Routine.id == routine_id))
+    if not result.rowcount:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rutina no encontrada")
 
-    session.delete(routine)
+    session.add(RoutineTombstone(routine_id=routine_id))
     session.commit()
+    record_activity(session, deleted=1)
+    snapshot.discard([routine_id])
+    publish(ROUTINES_TOPIC, [routine_id])
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@router.delete("", response_model=BulkDeleteRead)
+def delete_routines(
+    ids: Optional[List[int]] = Query(default=None, description="Ids de rutinas a eliminar"),
+    creada_antes: Optional[datetime] = Query(
+        default=None, description="Eliminar rutinas creadas antes de esta fecha"
+    ),
+    session: Session = Depends(get_session),
+) -> BulkDeleteRead:
+    if not ids and creada_antes is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se debe indicar ids o creada_antes",
+        )
+
+    conditions = []
+    if ids:
+        conditions.append(Routine.id.in_(ids))
+    if creada_antes is not None:
+        creada_antes = _naive_utc(creada_antes)
+        conditions.append(Routine.created_at < creada_antes)
+
+    session.execute(
+        insert(RoutineTombstone).from_select(
+            ["routine_id", "deleted_at"],
+            select(Routine.id, literal(datetime.utcnow())).where(*conditions),
+        )
+    )
+    result = session.execute(
+        delete(Routine).where(*conditions).execution_options(synchronize_session=False)
+    )
+    session.commit()
+    record_activity(session, deleted=result.rowcount)
+    snapshot.discard(ids or None, creada_antes)
+    publish(ROUTINES_TOPIC, ids or None)
+    return BulkDeleteRead(deleted=result.rowcount)
+
+
 @router.post(
     "/{routine_id}/duplicar",
     response_model=RoutineRead,
@@ -320,7 +578,7 @@ def duplicate_routine(
     for exercise in routine.exercises:
         new_routine.exercises.append(
             Exercise(
-                name=exercise.name,
+                catalog_id=exercise.catalog_id,
                 day_of_week=exercise.day_of_week,
                 series=exercise.series,
                 repetitions=exercise.repetitions,
@@ -332,7 +590,9 @@ def duplicate_routine(
 
     session.add(new_routine)
     session.commit()
+    record_activity(session, created=1)
     session.refresh(new_routine)
+    _routines_changed(session, new_routine.id)
     return new_routine
 
 
@@ -354,8 +614,10 @@ def add_exercise_to_routine(
     if not routine:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rutina no encontrada")
 
+    routine.updated_at = datetime.utcnow()
+    catalog = _catalog_entries(session, [exercise_data.name])
     exercise = Exercise(
-        name=exercise_data.name,
+        catalog=catalog[exercise_data.name],
         day_of_week=exercise_data.day_of_week,
         series=exercise_data.series,
         repetitions=exercise_data.repetitions,
@@ -367,10 +629,108 @@ def add_exercise_to_routine(
 
     session.add(exercise)
     session.commit()
+    record_activity(session, updated=1)
     session.refresh(exercise)
+    _routines_changed(session, exercise.routine_id)
     return exercise
 
 
+@router.post(
+    "/{routine_id}/ejercicios/lote",
+    response_model=List[ExerciseRead],
+    status_code=status.HTTP_201_CREATED,
+)
+def add_exercises_to_routine(
+    routine_id: int,
+    exercises_data: List[ExerciseIn],
+    session: Session = Depends(get_session),
+) -> List[ExerciseRead]:
+    if any(exercise_data.id for exercise_data in exercises_data):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No se debe enviar id al crear un ejercicio",
+        )
+
+    routine = session.get(Routine, routine_id)
+    if not routine:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rutina no encontrada")
+
+    if not exercises_data:
+        return []
+
+    routine.updated_at = datetime.utcnow()
+    catalog = _catalog_entries(session, (exercise_data.name for exercise_data in exercises_data))
+    exercises = [
+        Exercise(
+            catalog=catalog[exercise_data.name],
+            day_of_week=exercise_data.day_of_week,
+            series=exercise_data.series,
+            repetitions=exercise_data.repetitions,
+            weight=exercise_data.weight,
+            notes=exercise_data.notes,
+            order=exercise_data.order,
+            routine_id=routine_id,
+        )
+        for exercise_data in exercises_data
+    ]
+
+    # Un único flush permite al ORM agrupar los INSERT (executemany con RETURNING en PostgreSQL).
+    session.add_all(exercises)
+    session.flush()
+    inserted_ids = [exercise.id for exercise in exercises]
+    session.commit()
+    record_activity(session, updated=1)
+    _routines_changed(session, routine_id)
+
+    return session.exec(
+        select(Exercise).where(Exercise.id.in_(inserted_ids)).order_by(Exercise.id)
+    ).all()
+
+
+@router.put("/{routine_id}/orden", response_model=RoutineRead)
+def reorder_exercises(
+    routine_id: int, payload: ExerciseOrderUpdate, session: Session = Depends(get_session)
+) -> RoutineRead:
+    routine = session.get(Routine, routine_id)
+    if not routine:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rutina no encontrada")
+
+    owned_ids = set(
+        session.exec(select(Exercise.id).where(Exercise.routine_id == routine_id)).all()
+    )
+    for exercise_id in payload.ids:
+        if exercise_id not in owned_ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Ejercicio con id {exercise_id} no pertenece a la rutina",
+            )
+    # Un orden parcial dejaría posiciones repetidas con los ejercicios no enviados.
+    if set(payload.ids) != owned_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se deben enviar todos los ejercicios de la rutina",
+        )
+
+    now = datetime.utcnow()
+    routine.updated_at = now
+    positions = {exercise_id: position for position, exercise_id in enumerate(payload.ids, start=1)}
+    session.execute(
+        update(Exercise)
+        .where(Exercise.routine_id == routine_id, Exercise.id.in_(list(positions)))
+        .values(order=case(positions, value=Exercise.id), updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    record_activity(session, updated=1)
+    _routines_changed(session, routine_id)
+
+    return session.exec(
+        select(Routine)
+        .options(selectinload(Routine.exercises))
+        .where(Routine.id == routine_id)
+    ).one()
+
+
 @router.put("/ejercicios/{exercise_id}", response_model=ExerciseRead)
 def update_exercise(
     exercise_id: int, exercise_data: ExerciseIn, session: Session = Depends(get_session)
@@ -385,17 +745,21 @@ def update_exercise(
     if not exercise:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ejercicio no encontrado")
 
-    exercise.name = exercise_data.name
+    catalog = _catalog_entries(session, [exercise_data.name])
+    exercise.catalog = catalog[exercise_data.name]
     exercise.day_of_week = exercise_data.day_of_week
     exercise.series = exercise_data.series
     exercise.repetitions = exercise_data.repetitions
     exercise.weight = exercise_data.weight
     exercise.notes = exercise_data.notes
     exercise.order = exercise_data.order
+    _touch_routine(session, exercise.routine_id)
 
     session.add(exercise)
     session.commit()
+    record_activity(session, updated=1)
     session.refresh(exercise)
+    _routines_changed(session, exercise.routine_id)
     return exercise
 
 
@@ -405,6 +769,10 @@ def delete_exercise(exercise_id: int, session: Session = Depends(get_session)) -
     if not exercise:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ejercicio no encontrado")
 
+    routine_id = exercise.routine_id
     session.delete(exercise)
+    _touch_routine(session, routine_id)
     session.commit()
+    record_activity(session, updated=1)
+    _routines_changed(session, routine_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
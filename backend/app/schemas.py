@@ -1,4 +1,5 @@
-from datetime import datetime
+import enum
+from datetime import date, datetime
 from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field, validator
@@ -35,12 +36,50 @@ class ExerciseRead(ExerciseBase):
         orm_mode = True
 
 
+class ExerciseCatalogRead(BaseModel):
+    id: int
+    name: str
+    usage_count: int
+
+
+class ExerciseOrderUpdate(BaseModel):
+    ids: List[int] = Field(..., min_items=1)
+
+    @validator("ids")
+    def unique_ids(cls, value: List[int]) -> List[int]:
+        if len(set(value)) != len(value):
+            raise ValueError("La lista de ejercicios contiene ids repetidos")
+        return value
+
+
+class BulkDeleteRead(BaseModel):
+    deleted: int
+
+
 class StatsRead(BaseModel):
     total_routines: int
     total_exercises: int
     exercises_per_day: Dict[str, int]
 
 
+class StatsBucket(str, enum.Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class StatsBucketRead(BaseModel):
+    start: date
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+
+class StatsSeriesRead(BaseModel):
+    bucket: StatsBucket
+    items: List[StatsBucketRead]
+
+
 class RoutineBase(BaseModel):
     name: str = Field(..., min_length=1)
     description: Optional[str] = None
@@ -64,12 +103,27 @@ class RoutineUpdate(RoutineBase):
 class RoutineRead(RoutineBase):
     id: int
     created_at: datetime
+    updated_at: datetime
     exercises: List[ExerciseRead] = Field(default_factory=list)
 
     class Config:
         orm_mode = True
 
 
+class ReadModelCheckRead(BaseModel):
+    enabled: bool
+    consistent: bool
+    differences: List[str] = Field(default_factory=list)
+
+
+class RoutineChangesRead(BaseModel):
+    created: List[RoutineRead] = Field(default_factory=list)
+    updated: List[RoutineRead] = Field(default_factory=list)
+    deleted: List[int] = Field(default_factory=list)
+    next_cursor: Optional[str]
+    has_more: bool
+
+
 class PaginationMeta(BaseModel):
     total: int
     page: int
@@ -94,3 +148,26 @@ class PaginatedRoutineRead(BaseModel):
             items=items,
             meta=PaginationMeta(total=total, page=page, page_size=page_size, pages=pages),
         )
+
+
+class SqlStatementRead(BaseModel):
+    statement: str
+    parameters: str
+    executemany: bool
+    duration_ms: float
+
+
+class ProfileSummaryRead(BaseModel):
+    id: str
+    method: str
+    path: str
+    status_code: Optional[int]
+    started_at: datetime
+    duration_ms: float
+    sql_count: int
+    sql_ms: float
+
+
+class ProfileRead(ProfileSummaryRead):
+    sql: List[SqlStatementRead] = Field(default_factory=list)
+    call_tree: str
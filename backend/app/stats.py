@@ -0,0 +1,133 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from .database import dialect_insert
+from .models import Routine, RoutineDailyStats
+from .schemas import StatsBucket, StatsBucketRead
+
+logger = logging.getLogger(__name__)
+
+# Unos diez años de buckets diarios: acota el tamaño de la respuesta rellenada con ceros.
+MAX_SERIES_BUCKETS = 3660
+
+
+class SeriesRangeError(ValueError):
+    pass
+
+
+def record_activity(
+    session: Session, created: int = 0, updated: int = 0, deleted: int = 0
+) -> None:
+    """Suma la actividad del día al rollup en una transacción corta, después del commit.
+
+    Todas las escrituras del día tocan la misma fila: dentro de la transacción de la
+    escritura su bloqueo las serializaría hasta el commit. Si falla solo se registra en
+    el log; `python -m app.cli rebuild-stats` recalcula las altas.
+    """
+    if not (created or updated or deleted):
+        return
+    table = RoutineDailyStats.__table__
+    stmt = dialect_insert(session)(table).values(
+        day=datetime.utcnow().date(), created=created, updated=updated, deleted=deleted
+    )
+    try:
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.day],
+                set_={
+                    "created": table.c.created + created,
+                    "updated": table.c.updated + updated,
+                    "deleted": table.c.deleted + deleted,
+                },
+            )
+        )
+        session.commit()
+    except SQLAlchemyError:
+        session.rollback()
+        logger.exception("No se pudo actualizar el rollup de estadísticas")
+
+
+def rebuild_created(session: Session) -> int:
+    """Recalcula `created` desde `routine.created_at` (para bases anteriores al rollup)."""
+    per_day = session.exec(
+        select(func.date(Routine.created_at), func.count(Routine.id)).group_by(
+            func.date(Routine.created_at)
+        )
+    ).all()
+    existing = {row.day: row for row in session.exec(select(RoutineDailyStats)).all()}
+    for raw_day, count in per_day:
+        day = raw_day if isinstance(raw_day, date) else date.fromisoformat(raw_day)
+        row = existing.get(day) or RoutineDailyStats(day=day)
+        row.created = count
+        session.add(row)
+    session.commit()
+    return len(per_day)
+
+
+def bucket_start(day: date, bucket: StatsBucket) -> date:
+    if bucket == StatsBucket.WEEK:
+        return day - timedelta(days=day.weekday())
+    if bucket == StatsBucket.MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start: date, bucket: StatsBucket) -> date:
+    if bucket == StatsBucket.WEEK:
+        return start + timedelta(days=7)
+    if bucket == StatsBucket.MONTH:
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def _bucket_count(first: date, last: date, bucket: StatsBucket) -> int:
+    if bucket == StatsBucket.WEEK:
+        return (last - first).days // 7 + 1
+    if bucket == StatsBucket.MONTH:
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days + 1
+
+
+def series(
+    session: Session,
+    bucket: StatsBucket,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> List[StatsBucketRead]:
+    query = select(RoutineDailyStats).order_by(RoutineDailyStats.day)
+    if since:
+        query = query.where(RoutineDailyStats.day >= since)
+    if until:
+        query = query.where(RoutineDailyStats.day <= until)
+    rows = session.exec(query).all()
+    if not rows and not (since and until):
+        return []
+
+    totals: Dict[date, StatsBucketRead] = {}
+    for row in rows:
+        start = bucket_start(row.day, bucket)
+        item = totals.setdefault(start, StatsBucketRead(start=start))
+        item.created += row.created
+        item.updated += row.updated
+        item.deleted += row.deleted
+
+    # Los buckets sin actividad se devuelven en cero para que las series sean continuas.
+    first = bucket_start(since or rows[0].day, bucket)
+    last = bucket_start(until or rows[-1].day, bucket)
+    if _bucket_count(first, last, bucket) > MAX_SERIES_BUCKETS:
+        raise SeriesRangeError(
+            f"El rango supera el máximo de {MAX_SERIES_BUCKETS} buckets; usar un bucket mayor"
+        )
+    items = []
+    current = first
+    while True:
+        items.append(totals.get(current) or StatsBucketRead(start=current))
+        # Se corta antes de calcular el siguiente: pasar de `date.max` daría OverflowError.
+        if current >= last:
+            return items
+        current = _next_bucket(current, bucket)
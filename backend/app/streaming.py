@@ -0,0 +1,88 @@
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+import zstandard
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+
+from .database import get_engine
+from .models import Routine
+from .schemas import RoutineRead
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+
+    for coding in ("zstd", "gzip"):
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def _compress(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            # SYNC_FLUSH entrega cada lote al cliente sin esperar el final del stream.
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    elif encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+
+def _routine_batches(conditions: List) -> Iterator[bytes]:
+    # Paginación por clave (id) con sesión propia: memoria constante sin importar el total.
+    last_id = 0
+    with Session(get_engine()) as session:
+        while True:
+            routines = session.exec(
+                select(Routine)
+                .options(selectinload(Routine.exercises))
+                .where(*conditions, Routine.id > last_id)
+                .order_by(Routine.id)
+                .limit(STREAM_BATCH_SIZE)
+            ).all()
+            if not routines:
+                return
+            yield "".join(
+                RoutineRead.from_orm(routine).json() + "\n" for routine in routines
+            ).encode("utf-8")
+            last_id = routines[-1].id
+            session.expunge_all()
+
+
+def ndjson_response(request: Request, conditions: List) -> StreamingResponse:
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        _compress(_routine_batches(conditions), encoding),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers=headers,
+    )
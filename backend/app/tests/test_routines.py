@@ -1,16 +1,45 @@
+import json
 import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
 
 import pytest
+import zstandard
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlalchemy.pool import StaticPool
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, create_engine, select
 
 os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
 
 from app.main import app  # noqa: E402
 from app import database  # noqa: E402
+from app.config import Settings, get_settings  # noqa: E402
+from app.invalidation import (  # noqa: E402
+    ROUTINES_TOPIC,
+    FileInvalidationBus,
+    InvalidationBus,
+    PostgresInvalidationBus,
+    default_invalidation_file,
+    set_bus,
+)
 from app.database import get_session  # noqa: E402
-from app.models import DayOfWeek  # noqa: E402
+from app.models import (  # noqa: E402
+    DayOfWeek,
+    Exercise,
+    ExerciseCatalog,
+    Routine,
+    RoutineDailyStats,
+)
+from app import profiling  # noqa: E402
+from app.profiling import profile_store  # noqa: E402
+from app.routers.routines import _catalog_entries  # noqa: E402
+from app.read_model import invalidate_snapshot, load_snapshot, snapshot  # noqa: E402
+from app import streaming  # noqa: E402
+from app.stats import rebuild_created  # noqa: E402
+from app.streaming import negotiate_encoding  # noqa: E402
 
 
 @pytest.fixture(name="engine")
@@ -20,9 +49,93 @@ def engine_fixture():
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
     )
-    database.engine = engine
-    SQLModel.metadata.create_all(engine)
+    database.set_engine(engine)
+    database.init_db()
     yield engine
+    database.set_engine(None)
+
+
+class QueryBudget:
+    """Cuenta las sentencias SQL del bloque `with` y falla si superan el presupuesto."""
+
+    def __init__(self, engine, budget: int) -> None:
+        self.engine = engine
+        self.budget = budget
+        self.statements: list[str] = []
+
+    def __enter__(self) -> "QueryBudget":
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        if exc_type is None and len(self.statements) > self.budget:
+            pytest.fail(self.report(), pytrace=False)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(" ".join(statement.split()))
+
+    def report(self) -> str:
+        lines = [
+            f"Presupuesto SQL excedido: {len(self.statements)} sentencias (máximo {self.budget})",
+            "Sentencias repetidas:",
+        ]
+        seen: dict[str, int] = {}
+        for statement in self.statements:
+            seen[statement] = seen.get(statement, 0) + 1
+        lines += [f"  x{count} {statement}" for statement, count in seen.items() if count > 1]
+        lines.append("Detalle (+ = fuera de presupuesto):")
+        for index, statement in enumerate(self.statements, start=1):
+            marker = "+" if index > self.budget else " "
+            lines.append(f"{marker} {index:>3}. {statement}")
+        return "\n".join(lines)
+
+
+def query_budget(budget: int):
+    """Declara cuántas sentencias SQL puede ejecutar el bloque medido con `sql_budget`."""
+    return pytest.mark.query_budget(budget)
+
+
+@pytest.fixture(name="sql_budget")
+def sql_budget_fixture(request, engine):
+    marker = request.node.get_closest_marker("query_budget")
+    if marker is None:
+        pytest.fail("sql_budget requiere declarar @query_budget(n)", pytrace=False)
+    return QueryBudget(engine, marker.args[0])
+
+
+@pytest.fixture(name="seed_routines")
+def seed_routines_fixture(engine):
+    def seed(count: int) -> None:
+        with Session(engine) as session:
+            squat = ExerciseCatalog(name="Sentadilla")
+            row = ExerciseCatalog(name="Remo")
+            for index in range(count):
+                session.add(
+                    Routine(
+                        name=f"Rutina {index}",
+                        exercises=[
+                            Exercise(
+                                catalog=squat,
+                                day_of_week=DayOfWeek.LUNES,
+                                series=3,
+                                repetitions=10,
+                                order=1,
+                            ),
+                            Exercise(
+                                catalog=row,
+                                day_of_week=DayOfWeek.JUEVES,
+                                series=3,
+                                repetitions=10,
+                                order=2,
+                            ),
+                        ],
+                    )
+                )
+            session.commit()
+
+    return seed
 
 
 @pytest.fixture(name="client")
@@ -182,3 +295,853 @@ def test_pagination_and_stats(client: TestClient):
     assert stats.status_code == 200
     stats_body = stats.json()
     assert stats_body["total_routines"] >= 5
+
+
+def test_batch_add_and_reorder_exercises(client: TestClient):
+    routine = client.post(
+        "/api/rutinas",
+        json={"name": "Rutina Lote", "description": None, "exercises": []},
+    ).json()
+    routine_id = routine["id"]
+
+    batch = [
+        {
+            "name": name,
+            "day_of_week": DayOfWeek.LUNES.value,
+            "series": 3,
+            "repetitions": 10,
+            "order": position,
+        }
+        for position, name in enumerate(["Sentadilla", "Zancadas", "Prensa"], start=1)
+    ]
+    created = client.post(f"/api/rutinas/{routine_id}/ejercicios/lote", json=batch)
+    assert created.status_code == 201, created.text
+    exercises = created.json()
+    assert [ex["name"] for ex in exercises] == ["Sentadilla", "Zancadas", "Prensa"]
+    assert all(ex["routine_id"] == routine_id for ex in exercises)
+
+    new_order = [exercises[2]["id"], exercises[0]["id"], exercises[1]["id"]]
+    reordered = client.put(f"/api/rutinas/{routine_id}/orden", json={"ids": new_order})
+    assert reordered.status_code == 200, reordered.text
+    body = reordered.json()
+    assert [ex["id"] for ex in body["exercises"]] == new_order
+    assert [ex["order"] for ex in body["exercises"]] == [1, 2, 3]
+
+    foreign = client.put(f"/api/rutinas/{routine_id}/orden", json={"ids": [9999]})
+    assert foreign.status_code == 400
+
+    partial = client.put(f"/api/rutinas/{routine_id}/orden", json={"ids": [new_order[0]]})
+    assert partial.status_code == 400
+    unchanged = client.get(f"/api/rutinas/{routine_id}").json()
+    assert [ex["order"] for ex in unchanged["exercises"]] == [1, 2, 3]
+
+
+@pytest.fixture(name="profiling_settings")
+def profiling_settings_fixture(monkeypatch):
+    monkeypatch.setenv("DEBUG", "true")
+    monkeypatch.setenv("API_KEY", "clave-test")
+    get_settings.cache_clear()
+    profile_store.clear()
+    yield {"X-API-Key": "clave-test"}
+    get_settings.cache_clear()
+    profile_store.clear()
+
+
+def test_profiled_request_is_stored(client: TestClient, profiling_settings):
+    headers = profiling_settings
+    client.post(
+        "/api/rutinas",
+        json={"name": "Rutina Perfil", "description": None, "exercises": []},
+        headers=headers,
+    )
+
+    plain = client.get("/api/rutinas", headers=headers)
+    assert "X-Profile-Id" not in plain.headers
+
+    denied = client.get("/api/rutinas", headers={"X-Profile": "1"})
+    assert denied.status_code == 401
+
+    profiled = client.get("/api/rutinas", headers={**headers, "X-Profile": "1"})
+    assert profiled.status_code == 200
+    profile_id = profiled.headers["X-Profile-Id"]
+
+    listing = client.get("/api/perfiles", headers=headers).json()
+    assert [item["id"] for item in listing] == [profile_id]
+
+    detail = client.get(f"/api/perfiles/{profile_id}", headers=headers).json()
+    assert detail["path"] == "/api/rutinas"
+    assert detail["sql_count"] >= 2
+    assert "list_routines" in detail["call_tree"]
+
+    download = client.get(f"/api/perfiles/{profile_id}/descarga", headers=headers)
+    assert download.status_code == 200
+    assert download.content
+
+    with profiling._profiling_lock:
+        busy = client.get("/api/rutinas", headers={**headers, "X-Profile": "1"})
+    assert busy.status_code == 409
+
+
+def test_delete_routine_cascades_exercises(client: TestClient):
+    exercise = {
+        "name": "Dominadas",
+        "day_of_week": DayOfWeek.MARTES.value,
+        "series": 4,
+        "repetitions": 8,
+        "order": 1,
+    }
+    first = client.post(
+        "/api/rutinas",
+        json={"name": "Espalda A", "description": None, "exercises": [exercise]},
+    ).json()
+    second = client.post(
+        "/api/rutinas",
+        json={"name": "Espalda B", "description": None, "exercises": [exercise]},
+    ).json()
+    kept = client.post(
+        "/api/rutinas",
+        json={"name": "Espalda C", "description": None, "exercises": [exercise]},
+    ).json()
+
+    assert client.delete(f"/api/rutinas/{first['id']}").status_code == 204
+    assert client.delete(f"/api/rutinas/{first['id']}").status_code == 404
+
+    assert client.delete("/api/rutinas").status_code == 400
+    bulk = client.delete("/api/rutinas", params={"ids": [second["id"], 9999]})
+    assert bulk.status_code == 200
+    assert bulk.json()["deleted"] == 1
+
+    stats = client.get("/api/rutinas/estadisticas").json()
+    assert stats["total_routines"] == 1
+    assert stats["total_exercises"] == 1
+
+    by_date = client.delete("/api/rutinas", params={"creada_antes": "2999-01-01T00:00:00"})
+    assert by_date.json()["deleted"] == 1
+    assert client.get(f"/api/rutinas/{kept['id']}").status_code == 404
+    assert client.get("/api/rutinas/estadisticas").json()["total_exercises"] == 0
+
+
+@pytest.fixture(name="memory_client")
+def memory_client_fixture(client: TestClient):
+    load_snapshot()
+    yield client
+    snapshot.clear()
+
+
+def test_in_memory_read_model_tracks_writes(memory_client: TestClient, engine):
+    client = memory_client
+    leg_day = {
+        "name": "Sentadilla",
+        "day_of_week": DayOfWeek.LUNES.value,
+        "series": 5,
+        "repetitions": 5,
+        "order": 1,
+    }
+    legs = client.post(
+        "/api/rutinas",
+        json={"name": "Piernas", "description": None, "exercises": [leg_day]},
+    ).json()
+    client.post("/api/rutinas", json={"name": "Vacía", "description": None, "exercises": []})
+    client.post(
+        f"/api/rutinas/{legs['id']}/ejercicios",
+        json={**leg_day, "name": "Prensa", "day_of_week": DayOfWeek.JUEVES.value, "order": 2},
+    )
+
+    detail = client.get(f"/api/rutinas/{legs['id']}").json()
+    assert [ex["name"] for ex in detail["exercises"]] == ["Sentadilla", "Prensa"]
+
+    by_day = client.get("/api/rutinas", params={"dia": DayOfWeek.JUEVES.value}).json()
+    assert [item["id"] for item in by_day["items"]] == [legs["id"]]
+    assert client.get("/api/rutinas").json()["meta"]["total"] == 2
+
+    stats = client.get("/api/rutinas/estadisticas").json()
+    assert stats["total_exercises"] == 2
+    assert stats["exercises_per_day"] == {"Lunes": 1, "Jueves": 1}
+
+    assert client.delete(f"/api/rutinas/{legs['id']}").status_code == 204
+    assert client.get(f"/api/rutinas/{legs['id']}").status_code == 404
+    check = client.get("/api/rutinas/memoria/consistencia").json()
+    assert check == {"enabled": True, "consistent": True, "differences": []}
+
+    with Session(engine) as session:
+        session.add(Routine(name="Fuera de banda"))
+        session.commit()
+    check = client.get("/api/rutinas/memoria/consistencia").json()
+    assert not check["consistent"]
+    assert len(check["differences"]) == 1
+
+
+def test_in_memory_bulk_delete_accepts_dates_with_timezone(memory_client: TestClient):
+    client = memory_client
+    for name in ("Vieja", "Otra"):
+        client.post("/api/rutinas", json={"name": name, "description": None, "exercises": []})
+
+    response = client.delete("/api/rutinas", params={"creada_antes": "2999-01-01T03:00:00+03:00"})
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 2}
+    assert client.get("/api/rutinas").json()["meta"]["total"] == 0
+    check = client.get("/api/rutinas/memoria/consistencia").json()
+    assert check == {"enabled": True, "consistent": True, "differences": []}
+
+
+def test_exercise_catalog_interns_names(client: TestClient):
+    squat = {
+        "name": "Sentadilla",
+        "day_of_week": DayOfWeek.LUNES.value,
+        "series": 5,
+        "repetitions": 5,
+        "order": 1,
+    }
+    first = client.post(
+        "/api/rutinas",
+        json={"name": "Fuerza A", "description": None, "exercises": [squat]},
+    ).json()
+    client.post(
+        "/api/rutinas",
+        json={
+            "name": "Fuerza B",
+            "description": None,
+            "exercises": [squat, {**squat, "name": "Remo", "order": 2}],
+        },
+    )
+
+    catalog = client.get("/api/ejercicios").json()
+    assert [(entry["name"], entry["usage_count"]) for entry in catalog] == [
+        ("Sentadilla", 2),
+        ("Remo", 1),
+    ]
+
+    search = client.get("/api/ejercicios", params={"nombre": "sent"}).json()
+    assert [entry["name"] for entry in search] == ["Sentadilla"]
+
+    squat_id = search[0]["id"]
+    using = client.get(f"/api/ejercicios/{squat_id}/rutinas").json()
+    assert using["meta"]["total"] == 2
+    assert {item["name"] for item in using["items"]} == {"Fuerza A", "Fuerza B"}
+
+    exercise_id = first["exercises"][0]["id"]
+    renamed = client.put(
+        f"/api/rutinas/ejercicios/{exercise_id}", json={**squat, "name": "Sentadilla frontal"}
+    )
+    assert renamed.json()["name"] == "Sentadilla frontal"
+    usage = {entry["name"]: entry["usage_count"] for entry in client.get("/api/ejercicios").json()}
+    assert usage == {"Sentadilla": 1, "Sentadilla frontal": 1, "Remo": 1}
+
+
+@pytest.fixture(name="settle_seconds")
+def settle_seconds_fixture(monkeypatch):
+    def configure(seconds: float) -> None:
+        monkeypatch.setenv("CHANGES_SETTLE_SECONDS", str(seconds))
+        get_settings.cache_clear()
+
+    yield configure
+    get_settings.cache_clear()
+
+
+def test_change_feed_returns_only_deltas(client: TestClient, settle_seconds):
+    settle_seconds(0)
+    exercise = {
+        "name": "Plancha",
+        "day_of_week": DayOfWeek.SABADO.value,
+        "series": 3,
+        "repetitions": 1,
+        "order": 1,
+    }
+    old = client.post(
+        "/api/rutinas",
+        json={"name": "Core", "description": None, "exercises": [exercise]},
+    ).json()
+    doomed = client.post(
+        "/api/rutinas", json={"name": "Temporal", "description": None, "exercises": []}
+    ).json()
+    client.post("/api/rutinas", json={"name": "Estable", "description": None, "exercises": []})
+
+    initial = client.get("/api/rutinas/cambios").json()
+    assert {item["name"] for item in initial["created"]} == {"Core", "Temporal", "Estable"}
+    assert initial["has_more"] is False
+    cursor = initial["next_cursor"]
+
+    assert client.get("/api/rutinas/cambios", params={"since": cursor}).json()["created"] == []
+
+    exercise_id = old["exercises"][0]["id"]
+    client.put(f"/api/rutinas/ejercicios/{exercise_id}", json={**exercise, "series": 4})
+    client.delete(f"/api/rutinas/{doomed['id']}")
+    fresh = client.post(
+        "/api/rutinas", json={"name": "Nueva", "description": None, "exercises": []}
+    ).json()
+
+    delta = client.get("/api/rutinas/cambios", params={"since": cursor}).json()
+    assert [item["id"] for item in delta["updated"]] == [old["id"]]
+    assert delta["updated"][0]["exercises"][0]["series"] == 4
+    assert [item["id"] for item in delta["created"]] == [fresh["id"]]
+    assert delta["deleted"] == [doomed["id"]]
+
+    first_page = client.get("/api/rutinas/cambios", params={"since": cursor, "limit": 2}).json()
+    assert first_page["has_more"] is True
+    rest = client.get(
+        "/api/rutinas/cambios", params={"since": first_page["next_cursor"], "limit": 2}
+    ).json()
+    assert rest["has_more"] is False
+    assert len(rest["created"]) + len(rest["updated"]) + len(rest["deleted"]) == 1
+
+    assert client.get("/api/rutinas/cambios", params={"since": "ayer"}).status_code == 400
+
+
+def test_change_feed_accepts_dates_with_timezone(client: TestClient, settle_seconds):
+    settle_seconds(0)
+    client.post("/api/rutinas", json={"name": "Core", "description": None, "exercises": []})
+
+    utc = client.get("/api/rutinas/cambios", params={"since": "2020-01-01T00:00:00+00:00"})
+    assert utc.status_code == 200
+    assert [item["name"] for item in utc.json()["created"]] == ["Core"]
+
+    future = client.get("/api/rutinas/cambios", params={"since": "2999-01-01T03:00:00+03:00"})
+    assert future.status_code == 200
+    assert future.json()["created"] == []
+
+
+def test_change_feed_waits_for_late_commits(client: TestClient, engine, settle_seconds):
+    settle_seconds(60)
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        old = now - timedelta(minutes=5)
+        session.add(Routine(name="Vieja", created_at=old, updated_at=old))
+        session.add(Routine(name="Reciente", created_at=now, updated_at=now))
+        session.commit()
+
+    first = client.get("/api/rutinas/cambios").json()
+    assert [item["name"] for item in first["created"]] == ["Vieja"]
+
+    # Una transacción que fijó `updated_at` antes pero confirmó después del primer llamado.
+    with Session(engine) as session:
+        late = now - timedelta(seconds=30)
+        session.add(Routine(name="Tardía", created_at=late, updated_at=late))
+        session.commit()
+
+    settle_seconds(0)
+    second = client.get("/api/rutinas/cambios", params={"since": first["next_cursor"]}).json()
+    assert [item["name"] for item in second["created"]] == ["Tardía", "Reciente"]
+
+
+def test_file_bus_propagates_invalidations(memory_client: TestClient, engine, tmp_path):
+    client = memory_client
+    path = str(tmp_path / "invalidation.log")
+    set_bus(FileInvalidationBus(path))
+    other_worker = FileInvalidationBus(path)
+    received = []
+    other_worker.subscribe(ROUTINES_TOPIC, received.append)
+    try:
+        created = client.post(
+            "/api/rutinas", json={"name": "Bus", "description": None, "exercises": []}
+        ).json()
+        client.delete("/api/rutinas", params={"creada_antes": "2000-01-01T00:00:00"})
+        other_worker.poll()
+        assert received == [[created["id"]], None]
+
+        # Un cambio hecho por otro worker llega por el bus y actualiza la copia en memoria.
+        with Session(engine) as session:
+            routine = Routine(name="Desde otro worker")
+            session.add(routine)
+            session.commit()
+            routine_id = routine.id
+        listener = FileInvalidationBus(path)
+        listener.subscribe(ROUTINES_TOPIC, invalidate_snapshot)
+        other_worker.publish(ROUTINES_TOPIC, [routine_id])
+        listener.poll()
+        assert client.get(f"/api/rutinas/{routine_id}").status_code == 200
+        assert client.get("/api/rutinas/memoria/consistencia").json()["consistent"]
+    finally:
+        set_bus(InvalidationBus())
+
+
+def test_file_bus_rotates_without_losing_messages(tmp_path):
+    path = str(tmp_path / "invalidation.log")
+    writer = FileInvalidationBus(path, max_bytes=200)
+    reader = FileInvalidationBus(path, max_bytes=200)
+    received = []
+    reader.subscribe(ROUTINES_TOPIC, received.append)
+
+    for routine_id in range(1, 9):
+        writer.publish(ROUTINES_TOPIC, [routine_id])
+        if routine_id % 3 == 0:
+            reader.poll()
+    reader.poll()
+
+    assert received == [[routine_id] for routine_id in range(1, 9)]
+    assert not os.path.exists(path) or os.path.getsize(path) < 200
+    assert os.path.exists(path + ".1")
+    reader.stop()
+
+
+def test_file_bus_invalidates_everything_after_missing_a_rotation(tmp_path):
+    path = str(tmp_path / "invalidation.log")
+    writer = FileInvalidationBus(path, max_bytes=100)
+    writer.publish(ROUTINES_TOPIC, [1])
+    reader = FileInvalidationBus(path, max_bytes=100)
+    received = []
+    reader.subscribe(ROUTINES_TOPIC, received.append)
+
+    # Dos rotaciones entre lecturas: el primer archivo rotado ya no existe.
+    for routine_id in range(2, 12):
+        writer.publish(ROUTINES_TOPIC, [routine_id])
+    reader.poll()
+
+    assert received[-1] is None
+    reader.stop()
+
+
+def test_file_bus_restarts_when_the_file_is_truncated(tmp_path):
+    path = str(tmp_path / "invalidation.log")
+    writer = FileInvalidationBus(path)
+    reader = FileInvalidationBus(path)
+    received = []
+    reader.subscribe(ROUTINES_TOPIC, received.append)
+    writer.publish(ROUTINES_TOPIC, [1])
+    writer.publish(ROUTINES_TOPIC, [2])
+    reader.poll()
+
+    open(path, "wb").close()
+    writer.publish(ROUTINES_TOPIC, [3])
+    reader.poll()
+
+    assert received == [[1], [2], [3]]
+    reader.stop()
+
+
+def test_default_invalidation_file_is_specific_to_the_deployment():
+    first = Settings(database_url="sqlite:///./a.db", invalidation_channel="rutinas")
+    second = Settings(database_url="sqlite:///./b.db", invalidation_channel="rutinas")
+    assert default_invalidation_file(first) != default_invalidation_file(second)
+    assert default_invalidation_file(first) == default_invalidation_file(
+        Settings(database_url="sqlite:///./a.db", invalidation_channel="rutinas")
+    )
+
+
+class BrokenBus(InvalidationBus):
+    def _send(self, message: str) -> None:
+        raise ConnectionError("bus caído")
+
+
+def test_publish_failure_does_not_fail_committed_write(memory_client: TestClient):
+    set_bus(BrokenBus())
+    try:
+        response = memory_client.post(
+            "/api/rutinas", json={"name": "Sin bus", "description": None, "exercises": []}
+        )
+        assert response.status_code == 201
+        assert memory_client.get(f"/api/rutinas/{response.json()['id']}").status_code == 200
+    finally:
+        set_bus(InvalidationBus())
+
+
+def test_postgres_bus_keeps_reconnecting_after_errors():
+    attempts = []
+
+    class UnreachableEngine:
+        def raw_connection(self):
+            attempts.append(1)
+            if len(attempts) == 3:
+                bus._stop.set()
+            raise ConnectionError("sin conexión")
+
+    bus = PostgresInvalidationBus(UnreachableEngine(), "canal", poll_interval=0.01)
+    bus._run()
+    assert len(attempts) == 3
+
+
+IMPORT_BUDGET_SECONDS = 2.0
+
+
+def test_app_import_is_fast_and_side_effect_free():
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import app.main\n"
+        "from app import database\n"
+        "print(time.perf_counter() - start, database._engine is None, 'psycopg2' in sys.modules)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).resolve().parents[2],
+        env={**os.environ, "DATABASE_URL": "postgresql+psycopg2://u:p@127.0.0.1:1/nada"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, engine_is_lazy, driver_loaded = result.stdout.split()
+    assert engine_is_lazy == "True"
+    assert driver_loaded == "False"
+    assert float(elapsed) < IMPORT_BUDGET_SECONDS
+
+
+def test_schema_version_is_checked_instead_of_created():
+    empty = create_engine("sqlite://", poolclass=StaticPool)
+    database.set_engine(empty)
+    try:
+        with pytest.raises(database.SchemaVersionError):
+            database.check_schema()
+        database.init_db()
+        database.check_schema()
+    finally:
+        database.set_engine(None)
+
+
+def test_init_db_does_not_stamp_an_outdated_schema():
+    legacy = create_engine("sqlite://", poolclass=StaticPool)
+    with legacy.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE routine (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+            "description VARCHAR, created_at DATETIME NOT NULL)"
+        )
+    database.set_engine(legacy)
+    try:
+        with pytest.raises(database.SchemaVersionError, match="routine.updated_at"):
+            database.init_db()
+        with pytest.raises(database.SchemaVersionError):
+            database.check_schema()
+
+        with legacy.begin() as conn:
+            conn.exec_driver_sql(
+                "ALTER TABLE routine ADD COLUMN updated_at DATETIME NOT NULL "
+                "DEFAULT '2020-01-01 00:00:00'"
+            )
+            for column in ("name", "created_at", "updated_at"):
+                conn.exec_driver_sql(f"CREATE INDEX ix_routine_{column} ON routine ({column})")
+        database.init_db()
+        database.check_schema()
+    finally:
+        database.set_engine(None)
+
+
+@pytest.mark.parametrize("routines", [1, 100])
+@pytest.mark.parametrize(
+    "path, params",
+    [
+        pytest.param("/api/rutinas", {"page_size": 100}, marks=query_budget(3), id="listar"),
+        pytest.param(
+            "/api/rutinas",
+            {"page_size": 100, "dia": DayOfWeek.JUEVES.value},
+            marks=query_budget(3),
+            id="listar-dia",
+        ),
+        pytest.param(
+            "/api/rutinas/buscar",
+            {"nombre": "rutina", "page_size": 100},
+            marks=query_budget(3),
+            id="buscar",
+        ),
+        pytest.param("/api/rutinas/1", {}, marks=query_budget(2), id="detalle"),
+        pytest.param("/api/rutinas/estadisticas", {}, marks=query_budget(3), id="estadisticas"),
+        pytest.param(
+            "/api/rutinas/estadisticas/serie",
+            {"bucket": "month"},
+            marks=query_budget(1),
+            id="estadisticas-serie",
+        ),
+        pytest.param("/api/rutinas/export/csv", {}, marks=query_budget(2), id="csv"),
+        pytest.param("/api/rutinas/cambios", {"limit": 1000}, marks=query_budget(3), id="cambios"),
+        pytest.param("/api/ejercicios", {}, marks=query_budget(1), id="catalogo"),
+        pytest.param(
+            "/api/ejercicios/1/rutinas",
+            {"page_size": 100},
+            marks=query_budget(4),
+            id="catalogo-rutinas",
+        ),
+    ],
+)
+def test_endpoint_query_budget(client, seed_routines, sql_budget, routines, path, params):
+    seed_routines(routines)
+    with sql_budget:
+        response = client.get(path, params=params)
+    assert response.status_code == 200, response.text
+
+
+def _exercise_payloads(count: int, prefix: str = "Ejercicio") -> list[dict]:
+    return [
+        {
+            "name": f"{prefix} {index}",
+            "day_of_week": DayOfWeek.LUNES.value,
+            "series": 3,
+            "repetitions": 10,
+            "order": index + 1,
+        }
+        for index in range(count)
+    ]
+
+
+def _write_request(client: TestClient, case: str, size: int) -> tuple[str, str, dict]:
+    """Prepara los datos fuera del presupuesto y devuelve la petición a medir."""
+    created: list[dict] = []
+
+    def routine(exercises: int = size) -> dict:
+        created.append(
+            client.post(
+                "/api/rutinas",
+                json={
+                    "name": f"Base {len(created)}",
+                    "description": None,
+                    "exercises": _exercise_payloads(exercises),
+                },
+            ).json()
+        )
+        return created[-1]
+
+    if case == "crear":
+        payload = {"name": "Nueva", "description": None, "exercises": _exercise_payloads(size)}
+        return "POST", "/api/rutinas", {"json": payload}
+    if case == "editar":
+        base = routine()
+        payload = {
+            "name": "Editada",
+            "exercises": [{**exercise, "series": 5} for exercise in base["exercises"]],
+        }
+        return "PUT", f"/api/rutinas/{base['id']}", {"json": payload}
+    if case == "duplicar":
+        return "POST", f"/api/rutinas/{routine()['id']}/duplicar", {}
+    if case == "agregar":
+        payload = _exercise_payloads(1, "Otro")[0]
+        return "POST", f"/api/rutinas/{routine()['id']}/ejercicios", {"json": payload}
+    if case == "lote":
+        payload = _exercise_payloads(size, "Lote")
+        return "POST", f"/api/rutinas/{routine(1)['id']}/ejercicios/lote", {"json": payload}
+    if case == "orden":
+        ids = [exercise["id"] for exercise in reversed(routine()["exercises"])]
+        return "PUT", f"/api/rutinas/{created[-1]['id']}/orden", {"json": {"ids": ids}}
+    if case == "editar-ejercicio":
+        exercise = routine()["exercises"][0]
+        payload = {**_exercise_payloads(1)[0], "series": 9}
+        return "PUT", f"/api/rutinas/ejercicios/{exercise['id']}", {"json": payload}
+    if case == "eliminar-ejercicio":
+        exercise = routine()["exercises"][0]
+        return "DELETE", f"/api/rutinas/ejercicios/{exercise['id']}", {}
+    if case == "eliminar":
+        return "DELETE", f"/api/rutinas/{routine()['id']}", {}
+    if case == "eliminar-lote":
+        ids = [routine(1)["id"] for _ in range(size)]
+        return "DELETE", "/api/rutinas", {"params": {"ids": ids}}
+    raise ValueError(case)
+
+
+def _write_budget(case: str, size: int, budget: int):
+    return pytest.param(case, size, marks=query_budget(budget), id=f"{case}-{size}")
+
+
+@pytest.mark.parametrize(
+    "case, size",
+    [
+        # SQLite no tiene RETURNING en SQLAlchemy 1.4: el ORM emite un INSERT por ejercicio
+        # para conocer su id. El presupuesto lo deja explícito como `fijo + size`.
+        _write_budget("crear", 1, 8 + 1),
+        _write_budget("crear", 50, 8 + 50),
+        _write_budget("duplicar", 1, 7 + 1),
+        _write_budget("duplicar", 50, 7 + 50),
+        _write_budget("lote", 1, 7 + 1),
+        _write_budget("lote", 50, 7 + 50),
+        # El resto no depende de la cantidad de ejercicios ni de rutinas.
+        _write_budget("editar", 1, 9),
+        _write_budget("editar", 50, 9),
+        _write_budget("agregar", 1, 8),
+        _write_budget("agregar", 50, 8),
+        _write_budget("orden", 1, 7),
+        _write_budget("orden", 50, 7),
+        _write_budget("editar-ejercicio", 1, 6),
+        _write_budget("editar-ejercicio", 50, 6),
+        _write_budget("eliminar-ejercicio", 1, 4),
+        _write_budget("eliminar-ejercicio", 50, 4),
+        _write_budget("eliminar", 1, 3),
+        _write_budget("eliminar", 50, 3),
+        _write_budget("eliminar-lote", 1, 3),
+        _write_budget("eliminar-lote", 50, 3),
+    ],
+)
+def test_write_endpoint_query_budget(client, sql_budget, case, size):
+    method, path, kwargs = _write_request(client, case, size)
+    with sql_budget:
+        response = client.request(method, path, **kwargs)
+    assert response.status_code < 300, response.text
+
+
+def test_query_budget_reports_repeated_statements(engine, seed_routines):
+    seed_routines(3)
+    with pytest.raises(pytest.fail.Exception) as failure:
+        with QueryBudget(engine, 1), Session(engine) as session:
+            for routine in session.exec(select(Routine)).all():
+                routine.exercises  # carga perezosa: una consulta por rutina
+    report = str(failure.value)
+    assert "4 sentencias (máximo 1)" in report
+    assert "x3 SELECT exercise" in report
+
+
+def test_ndjson_listing_streams_everything_compressed(
+    client: TestClient, seed_routines, monkeypatch
+):
+    monkeypatch.setattr(streaming, "STREAM_BATCH_SIZE", 50)
+    seed_routines(120)
+    ndjson = {"Accept": "application/x-ndjson"}
+
+    plain = client.get("/api/rutinas", headers={**ndjson, "Accept-Encoding": "identity"})
+    assert plain.status_code == 200
+    assert plain.headers["content-type"].startswith("application/x-ndjson")
+    assert "content-encoding" not in plain.headers
+    lines = [json.loads(line) for line in plain.text.splitlines()]
+    assert len(lines) == 120
+    assert len(lines[0]["exercises"]) == 2
+
+    compressed = client.get("/api/rutinas", headers={**ndjson, "Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.text == plain.text
+    assert int(compressed.num_bytes_downloaded) < len(plain.content)
+
+    zstd = client.get("/api/rutinas", headers={**ndjson, "Accept-Encoding": "zstd"})
+    assert zstd.headers["content-encoding"] == "zstd"
+    assert zstd.headers["vary"] == "Accept, Accept-Encoding"
+    decompressed = zstandard.ZstdDecompressor().decompressobj().decompress(zstd.content)
+    assert decompressed == plain.content
+    assert len(zstd.content) < len(plain.content)
+
+    paginated = client.get("/api/rutinas")
+    assert paginated.headers["content-type"] == "application/json"
+    assert paginated.headers["vary"] == "Accept"
+    assert client.get("/api/rutinas/buscar", params={"nombre": "1"}).headers["vary"] == "Accept"
+
+    by_day = client.get(
+        "/api/rutinas/buscar",
+        params={"nombre": "rutina 11", "dia": DayOfWeek.JUEVES.value},
+        headers=ndjson,
+    )
+    names = {json.loads(line)["name"] for line in by_day.text.splitlines()}
+    assert names == {"Rutina 11"} | {f"Rutina {index}" for index in range(110, 120)}
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("br, gzip") == "gzip"
+    assert negotiate_encoding("*") == "zstd"
+    assert negotiate_encoding("zstd;q=0, gzip") == "gzip"
+
+
+def test_stats_series_buckets_rollup(client: TestClient, engine):
+    with Session(engine) as session:
+        session.add(RoutineDailyStats(day=date(2024, 1, 30), created=2))
+        session.add(RoutineDailyStats(day=date(2024, 2, 1), created=1, updated=3))
+        session.add(RoutineDailyStats(day=date(2024, 2, 12), deleted=1))
+        session.commit()
+
+    weekly = client.get(
+        "/api/rutinas/estadisticas/serie",
+        params={"bucket": "week", "desde": "2024-01-29", "hasta": "2024-02-18"},
+    ).json()
+    assert weekly["items"] == [
+        {"start": "2024-01-29", "created": 3, "updated": 3, "deleted": 0},
+        {"start": "2024-02-05", "created": 0, "updated": 0, "deleted": 0},
+        {"start": "2024-02-12", "created": 0, "updated": 0, "deleted": 1},
+    ]
+
+    monthly = client.get(
+        "/api/rutinas/estadisticas/serie", params={"bucket": "month", "hasta": "2024-12-31"}
+    ).json()
+    assert [item["start"] for item in monthly["items"]][:2] == ["2024-01-01", "2024-02-01"]
+    assert monthly["items"][0]["created"] == 2
+    assert len(monthly["items"]) == 12
+
+    created = client.post(
+        "/api/rutinas", json={"name": "Hoy", "description": None, "exercises": []}
+    ).json()
+    client.put(f"/api/rutinas/{created['id']}", json={"name": "Hoy editada", "exercises": []})
+    client.delete(f"/api/rutinas/{created['id']}")
+    today = datetime.utcnow().date().isoformat()
+    daily = client.get(
+        "/api/rutinas/estadisticas/serie", params={"desde": today, "hasta": today}
+    ).json()
+    assert daily["items"] == [{"start": today, "created": 1, "updated": 1, "deleted": 1}]
+
+    invalid = client.get(
+        "/api/rutinas/estadisticas/serie", params={"desde": "2024-02-01", "hasta": "2024-01-01"}
+    )
+    assert invalid.status_code == 400
+
+
+def test_stats_rollup_failure_does_not_undo_the_write(client: TestClient, engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE routine_daily_stats")
+
+    response = client.post(
+        "/api/rutinas", json={"name": "Sin rollup", "description": None, "exercises": []}
+    )
+    assert response.status_code == 201
+    assert client.get(f"/api/rutinas/{response.json()['id']}").status_code == 200
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+def test_stats_series_stops_at_the_last_representable_date(client: TestClient, bucket):
+    response = client.get(
+        "/api/rutinas/estadisticas/serie",
+        params={"bucket": bucket, "desde": "9999-12-30", "hasta": "9999-12-31"},
+    )
+    assert response.status_code == 200
+    assert response.json()["items"][-1]["start"] <= "9999-12-31"
+
+
+def test_stats_series_rejects_ranges_with_too_many_buckets(client: TestClient):
+    huge = {"desde": "0001-01-01", "hasta": "9999-12-31"}
+    response = client.get("/api/rutinas/estadisticas/serie", params=huge)
+    assert response.status_code == 400
+
+    monthly = client.get(
+        "/api/rutinas/estadisticas/serie",
+        params={"bucket": "month", "desde": "2000-01-01", "hasta": "2024-12-31"},
+    )
+    assert monthly.status_code == 200
+    assert len(monthly.json()["items"]) == 300
+
+
+def test_rebuild_created_backfills_from_created_at(engine):
+    with Session(engine) as session:
+        session.add(Routine(name="Vieja 1", created_at=datetime(2023, 5, 4, 10)))
+        session.add(Routine(name="Vieja 2", created_at=datetime(2023, 5, 4, 18)))
+        session.commit()
+        assert rebuild_created(session) == 1
+        row = session.get(RoutineDailyStats, date(2023, 5, 4))
+        assert row.created == 2
+
+
+def test_snapshot_refresh_ignores_older_reads(memory_client: TestClient, engine):
+    created = memory_client.post(
+        "/api/rutinas", json={"name": "Versión nueva", "description": None, "exercises": []}
+    ).json()
+
+    with Session(engine) as session:
+        routine = session.get(Routine, created["id"])
+        routine.name = "Versión vieja"
+        routine.updated_at = datetime(2000, 1, 1)
+        session.add(routine)
+        session.commit()
+        snapshot.refresh(session, created["id"])
+
+    assert snapshot.get(created["id"]).name == "Versión nueva"
+
+
+def test_catalog_entries_tolerate_names_created_concurrently(engine):
+    raced = []
+
+    def concurrent_insert(conn, cursor, statement, parameters, context, executemany):
+        # Simula otra petición que crea el nombre entre la lectura y el INSERT.
+        if statement.startswith("INSERT INTO exercise_catalog") and not raced:
+            raced.append(statement)
+            cursor.connection.execute(
+                "INSERT INTO exercise_catalog (name) VALUES ('Hip thrust')"
+            )
+
+    event.listen(engine, "before_cursor_execute", concurrent_insert)
+    try:
+        with Session(engine) as session:
+            entries = _catalog_entries(session, ["Hip thrust", "Face pull"])
+            session.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", concurrent_insert)
+
+    assert raced
+    assert set(entries) == {"Hip thrust", "Face pull"}
+    with Session(engine) as session:
+        assert len(session.exec(select(ExerciseCatalog)).all()) == 2
@@ -0,0 +1,59 @@
+"""
+Migra bases existentes al catálogo normalizado de ejercicios.
+Crea `exercise_catalog`, deduplica los nombres de `exercise.name`, completa
+`exercise.catalog_id` y elimina la columna de texto. Es idempotente:
+
+    python scripts/migrate_exercise_catalog.py
+"""
+from sqlalchemy import inspect, text
+
+from app.database import get_engine
+from app.models import ExerciseCatalog
+
+
+def main() -> None:
+    engine = get_engine()
+    inspector = inspect(engine)
+    if not inspector.has_table("exercise"):
+        print("No existe la tabla exercise, no hay nada que migrar.")
+        return
+
+    columns = {column["name"] for column in inspector.get_columns("exercise")}
+    if "name" not in columns:
+        print("La tabla exercise ya usa el catálogo, no se realizan cambios.")
+        return
+
+    ExerciseCatalog.__table__.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        if "catalog_id" not in columns:
+            conn.execute(
+                text(
+                    "ALTER TABLE exercise ADD COLUMN catalog_id INTEGER "
+                    "REFERENCES exercise_catalog (id)"
+                )
+            )
+        inserted = conn.execute(
+            text(
+                "INSERT INTO exercise_catalog (name) "
+                "SELECT DISTINCT name FROM exercise "
+                "WHERE name NOT IN (SELECT name FROM exercise_catalog)"
+            )
+        ).rowcount
+        conn.execute(
+            text(
+                "UPDATE exercise SET catalog_id = "
+                "(SELECT c.id FROM exercise_catalog c WHERE c.name = exercise.name)"
+            )
+        )
+        conn.execute(
+            text("CREATE INDEX IF NOT EXISTS ix_exercise_catalog_id ON exercise (catalog_id)")
+        )
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE exercise ALTER COLUMN catalog_id SET NOT NULL"))
+        conn.execute(text("ALTER TABLE exercise DROP COLUMN name"))
+
+    print(f"Migración completa: {inserted} nombres de ejercicio en el catálogo.")
+
+
+if __name__ == "__main__":
+    main()
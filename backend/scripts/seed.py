@@ -8,13 +8,13 @@ from datetime import datetime
 
 from sqlmodel import Session
 
-from app.database import engine, init_db
-from app.models import DayOfWeek, Exercise, Routine
+from app.database import get_engine, init_db
+from app.models import DayOfWeek, Exercise, ExerciseCatalog, Routine
 
 
 def main() -> None:
     init_db()
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         if session.query(Routine).count() > 0:
             print("La base ya tiene datos, no se agregan seeds.")
             return
@@ -25,7 +25,7 @@ def main() -> None:
             created_at=datetime.utcnow(),
             exercises=[
                 Exercise(
-                    name="Sentadilla",
+                    catalog=ExerciseCatalog(name="Sentadilla"),
                     day_of_week=DayOfWeek.LUNES,
                     series=5,
                     repetitions=5,
@@ -34,7 +34,7 @@ def main() -> None:
                     order=1,
                 ),
                 Exercise(
-                    name="Press banca",
+                    catalog=ExerciseCatalog(name="Press banca"),
                     day_of_week=DayOfWeek.MIERCOLES,
                     series=5,
                     repetitions=5,
@@ -42,7 +42,7 @@ def main() -> None:
                     order=1,
                 ),
                 Exercise(
-                    name="Peso muerto",
+                    catalog=ExerciseCatalog(name="Peso muerto"),
                     day_of_week=DayOfWeek.VIERNES,
                     series=3,
                     repetitions=5,